@@ -6,11 +6,12 @@ weather.
 from os import getenv
 from dotenv import load_dotenv
 import psycopg2
-from weather import get_cities
+from spatial import get_city_index
 
 load_dotenv()
 
-def get_stats_for_city(city_name: str, period: str = 'today') -> tuple[str, float, float, float]:
+def get_stats_for_city(city_name: str, period: str = 'today',
+                       conn=None) -> tuple[str, float, float, float]:
     '''
     Gives some analytical data about city's temperatures.
 
@@ -21,16 +22,20 @@ def get_stats_for_city(city_name: str, period: str = 'today') -> tuple[str, floa
             yesterday
             current_week
             last_7_days
+        conn - an open database connection to use, a new one is opened and closed if not provided.
+            Errors are raised when it is provided, instead of being printed
 
     Returns:
         a tuple with the following values for the defined timeframe:
             city name, maximum temperature, minimum temperature, temperature standard deviation
     '''
 
-    conn = psycopg2.connect(database = getenv('DB_NAME'),
-                        host = getenv('DB_HOSTNAME'),
-                        user = getenv('DB_USERNAME'),
-                        password = getenv('DB_PASSWORD'))
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(database = getenv('DB_NAME'),
+                            host = getenv('DB_HOSTNAME'),
+                            user = getenv('DB_USERNAME'),
+                            password = getenv('DB_PASSWORD'))
 
     try:
         cursor = conn.cursor()
@@ -76,23 +81,32 @@ def get_stats_for_city(city_name: str, period: str = 'today') -> tuple[str, floa
 
         return cursor.fetchall()
     except Exception as error:
+        if not own_conn:
+            raise
         print("Database error:", error)
     finally:
         cursor.close()
-        conn.close()
+        if own_conn:
+            conn.close()
 
-def get_countries() -> tuple[str]:
+def get_countries(conn=None) -> tuple[str]:
     '''
     A helper function that finds the countries of all cities there are in the database.
 
+    Arguments:
+        conn - an open database connection to use, a new one is opened and closed if not provided.
+            Errors are raised when it is provided, instead of being printed
+
     Returns:
         a tuple with country codes
     '''
 
-    conn = psycopg2.connect(database = getenv('DB_NAME'),
-                        host = getenv('DB_HOSTNAME'),
-                        user = getenv('DB_USERNAME'),
-                        password = getenv('DB_PASSWORD'))
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(database = getenv('DB_NAME'),
+                            host = getenv('DB_HOSTNAME'),
+                            user = getenv('DB_USERNAME'),
+                            password = getenv('DB_PASSWORD'))
 
     try:
         cursor = conn.cursor()
@@ -100,12 +114,16 @@ def get_countries() -> tuple[str]:
 
         return cursor.fetchall()
     except Exception as error:
+        if not own_conn:
+            raise
         print("Database error:", error)
     finally:
         cursor.close()
-        conn.close()
+        if own_conn:
+            conn.close()
 
-def get_stats_for_country(country_name: str, period: str = 'today') -> tuple[str, float, float, float]:
+def get_stats_for_country(country_name: str, period: str = 'today',
+                          conn=None) -> tuple[str, float, float, float]:
     '''
     Gives some analytical data about city's temperatures.
 
@@ -116,16 +134,20 @@ def get_stats_for_country(country_name: str, period: str = 'today') -> tuple[str
             yesterday
             current_week
             last_7_days
+        conn - an open database connection to use, a new one is opened and closed if not provided.
+            Errors are raised when it is provided, instead of being printed
 
     Returns:
         a tuple with the following values for the defined timeframe:
             country name, maximum temperature, minimum temperature, temperature standard deviation
     '''
 
-    conn = psycopg2.connect(database = getenv('DB_NAME'),
-                        host = getenv('DB_HOSTNAME'),
-                        user = getenv('DB_USERNAME'),
-                        password = getenv('DB_PASSWORD'))
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(database = getenv('DB_NAME'),
+                            host = getenv('DB_HOSTNAME'),
+                            user = getenv('DB_USERNAME'),
+                            password = getenv('DB_PASSWORD'))
 
     try:
         cursor = conn.cursor()
@@ -171,15 +193,137 @@ def get_stats_for_country(country_name: str, period: str = 'today') -> tuple[str
 
         return cursor.fetchall()
     except Exception as error:
+        if not own_conn:
+            raise
         print("Database error:", error)
     finally:
         cursor.close()
-        conn.close()
+        if own_conn:
+            conn.close()
+
+def get_stats_for_region(city_ids: list[int], period: str = 'today',
+                         conn=None) -> tuple[int, float, float, float]:
+    '''
+    Gives some analytical data about temperatures in a region made of any set of cities, for
+    example the ones found with the spatial index. The periods are plain ranges on the time
+    column, so the (city_id, time) index from spatial.create_database_indexes() can be used.
+
+    Arguments:
+        city_ids - a list of city_id values of the cities, that make up the region
+        period - for which period you want to take the statistics. Valid values are:
+            today (the default)
+            yesterday
+            current_week
+            last_7_days
+        conn - an open database connection to use, a new one is opened and closed if not provided.
+            Errors are raised when it is provided, instead of being printed
 
-def get_hottest_cities():
+    Returns:
+        a tuple with the following values for the defined timeframe:
+            number of cities, maximum temperature, minimum temperature, temperature standard deviation
+    '''
+
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(database = getenv('DB_NAME'),
+                            host = getenv('DB_HOSTNAME'),
+                            user = getenv('DB_USERNAME'),
+                            password = getenv('DB_PASSWORD'))
+
+    try:
+        cursor = conn.cursor()
+        if period == 'today':
+            cursor.execute("""
+                        SELECT COUNT(DISTINCT w.city_id), MAX(w.temperature), MIN(w.temperature),
+                        STDDEV(w.temperature)
+                        FROM weather w
+                        WHERE w.city_id = ANY(%s)
+                        AND w.time >= CURRENT_DATE AND w.time < CURRENT_DATE + 1;
+                        """, (list(city_ids), ))
+        elif period == 'yesterday':
+            cursor.execute("""
+                        SELECT COUNT(DISTINCT w.city_id), MAX(w.temperature), MIN(w.temperature),
+                        STDDEV(w.temperature)
+                        FROM weather w
+                        WHERE w.city_id = ANY(%s)
+                        AND w.time >= CURRENT_DATE - 1 AND w.time < CURRENT_DATE;
+                        """, (list(city_ids), ))
+        elif period == 'current_week':
+            cursor.execute("""
+                        SELECT COUNT(DISTINCT w.city_id), MAX(w.temperature), MIN(w.temperature),
+                        STDDEV(w.temperature)
+                        FROM weather w
+                        WHERE w.city_id = ANY(%s) AND w.time >= date_trunc('week', current_date);
+                        """, (list(city_ids), ))
+        elif period == 'last_7_days':
+            cursor.execute("""
+                        SELECT COUNT(DISTINCT w.city_id), MAX(w.temperature), MIN(w.temperature),
+                        STDDEV(w.temperature)
+                        FROM weather w
+                        WHERE w.city_id = ANY(%s)
+                        AND w.time >= CURRENT_DATE - 6;
+                        """, (list(city_ids), ))
+        else:
+            raise Exception("Invalid 'period' parameter. Valid ones are: today, yesterday,"
+                            "current_week, last_7_days.")
+
+        return cursor.fetchall()
+    except Exception as error:
+        if not own_conn:
+            raise
+        print("Database error:", error)
+    finally:
+        cursor.close()
+        if own_conn:
+            conn.close()
+
+def get_stats_for_radius(latitude: float, longtitude: float, distance: float,
+                         period: str = 'today', conn=None) -> tuple[int, float, float, float]:
+    '''
+    Gives some analytical data about temperatures in cities within the distance from a place.
+
+    Arguments:
+        latitude - a geographical latitude of the place
+        longtitude - a geographical longtitude of the place
+        distance - a radius in kilometers
+        period - for which period you want to take the statistics, as in get_stats_for_region()
+        conn - an open database connection to use, a new one is opened and closed if not provided.
+            Errors are raised when it is provided, instead of being printed
+
+    Returns:
+        the same values as get_stats_for_region()
+    '''
+    cities = get_city_index(conn).within_radius(latitude, longtitude, distance)
+    return get_stats_for_region([city[0] for _, city in cities], period, conn)
+
+def get_stats_for_bounding_box(min_latitude: float, min_longtitude: float, max_latitude: float,
+                               max_longtitude: float, period: str = 'today',
+                               conn=None) -> tuple[int, float, float, float]:
+    '''
+    Gives some analytical data about temperatures in cities inside a bounding box.
+
+    Arguments:
+        min_latitude, min_longtitude - the south-west corner of the box
+        max_latitude, max_longtitude - the north-east corner of the box
+        period - for which period you want to take the statistics, as in get_stats_for_region()
+        conn - an open database connection to use, a new one is opened and closed if not provided.
+            Errors are raised when it is provided, instead of being printed
+
+    Returns:
+        the same values as get_stats_for_region()
+    '''
+    cities = get_city_index(conn).within_bounding_box(min_latitude, min_longtitude,
+                                                      max_latitude, max_longtitude)
+    return get_stats_for_region([city[0] for city in cities], period, conn)
+
+def get_hottest_cities(conn=None):
     '''
     Gets the hottest cities in various timeframes
 
+    Arguments:
+        conn - an open database connection to use, a new one is opened and closed if not provided.
+            Errors are raised when it is provided, instead of being printed
+
     Returns:
         a tuple with 3 elements, hourly, daily and weekly list of hottest cities with time
         indicating respective hottest measurement, the temperature and city name.
@@ -188,10 +332,12 @@ def get_hottest_cities():
         none
     '''
 
-    conn = psycopg2.connect(database = getenv('DB_NAME'),
-                        host = getenv('DB_HOSTNAME'),
-                        user = getenv('DB_USERNAME'),
-                        password = getenv('DB_PASSWORD'))
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(database = getenv('DB_NAME'),
+                            host = getenv('DB_HOSTNAME'),
+                            user = getenv('DB_USERNAME'),
+                            password = getenv('DB_PASSWORD'))
 
     try:
         cursor = conn.cursor()
@@ -239,24 +385,33 @@ def get_hottest_cities():
 
         return hourly, daily, weekly
     except Exception as error:
+        if not own_conn:
+            raise
         print("Database error:", error)
     finally:
         cursor.close()
-        conn.close()
+        if own_conn:
+            conn.close()
 
-def get_coldest_cities():
+def get_coldest_cities(conn=None):
     '''
     Gets the coldest cities in various timeframes
 
+    Arguments:
+        conn - an open database connection to use, a new one is opened and closed if not provided.
+            Errors are raised when it is provided, instead of being printed
+
     Returns:
         a tuple with 3 elements, hourly, daily and weekly list of coldest cities with time
         indicating the measurement, the temperature and city name.
     '''
 
-    conn = psycopg2.connect(database = getenv('DB_NAME'),
-                        host = getenv('DB_HOSTNAME'),
-                        user = getenv('DB_USERNAME'),
-                        password = getenv('DB_PASSWORD'))
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(database = getenv('DB_NAME'),
+                            host = getenv('DB_HOSTNAME'),
+                            user = getenv('DB_USERNAME'),
+                            password = getenv('DB_PASSWORD'))
 
     try:
         cursor = conn.cursor()
@@ -304,15 +459,22 @@ def get_coldest_cities():
 
         return hourly, daily, weekly
     except Exception as error:
+        if not own_conn:
+            raise
         print("Database error:", error)
     finally:
         cursor.close()
-        conn.close()
+        if own_conn:
+            conn.close()
 
-def get_rainy_days() -> tuple[tuple[str, float]]:
+def get_rainy_days(conn=None) -> tuple[tuple[str, float]]:
     '''
     Get's the number of rainy hours in a city.
 
+    Arguments:
+        conn - an open database connection to use, a new one is opened and closed if not provided.
+            Errors are raised when it is provided, instead of being printed
+
     Returns:
         a tuples with two elements:
             yesterday - a list of cities that were rainy yesterday and how many rain hours city had
@@ -320,10 +482,12 @@ def get_rainy_days() -> tuple[tuple[str, float]]:
 
     '''
 
-    conn = psycopg2.connect(database = getenv('DB_NAME'),
-                        host = getenv('DB_HOSTNAME'),
-                        user = getenv('DB_USERNAME'),
-                        password = getenv('DB_PASSWORD'))
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(database = getenv('DB_NAME'),
+                            host = getenv('DB_HOSTNAME'),
+                            user = getenv('DB_USERNAME'),
+                            password = getenv('DB_PASSWORD'))
 
     try:
         cursor = conn.cursor()
@@ -350,14 +514,18 @@ def get_rainy_days() -> tuple[tuple[str, float]]:
 
         return yesterday, last_week
     except Exception as error:
+        if not own_conn:
+            raise
         print("Database error:", error)
     finally:
         cursor.close()
-        conn.close()
+        if own_conn:
+            conn.close()
 
 # Uncomment to test
 # if __name__ == "__main__":
     # This part will get statistics for cities in different timeframes
+    # from weather import get_cities
     # for city_id, name, lat, lon, _ in get_cities():
         # print(get_stats_for_city(name))
         # print(get_stats_for_city(name, 'today'))
@@ -373,6 +541,12 @@ def get_rainy_days() -> tuple[tuple[str, float]]:
     #     print(get_stats_for_country(country, 'current_week'))
     #     print(get_stats_for_country(country, 'last_7_days'))
 
+    # This part will get statistics for the region around Berlin and for a box around the Alps
+    # print(get_city_index().nearest(52.52, 13.40, 3))
+    # print(get_stats_for_radius(52.52, 13.40, 500))
+    # print(get_stats_for_radius(52.52, 13.40, 500, 'last_7_days'))
+    # print(get_stats_for_bounding_box(45.0, 5.0, 48.5, 16.5, 'current_week'))
+
     # This will give you the list of hottest cities in different timeframes
     # hourly, daily, weekly = get_hottest_cities()
     # print("Hourly:\n", hourly)
@@ -1,15 +1,19 @@
 '''
-A set of functions to measure how long will it take to download
+A set of functions to measure how long will it take to download the weather data, and how long
+will it take the tools to start.
 '''
 
+import io
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
 import time
 import asyncio
 from concurrent import futures
 from weather import get_cities, get_city_weather
 
-cities = get_cities()
-location = [(lat, lon) for _, _, lat, lon, _ in cities]
-
 def sequential(locations):
     result = []
     for lat, lon in locations:
@@ -43,10 +47,73 @@ async def coro_get_city_weather(lat, lon):
 
 
 def main(downloader):
+    location = [(lat, lon) for _, _, lat, lon, _ in get_cities()]
+
     t0 = time.perf_counter()
     count = downloader(location)
     elapsed = time.perf_counter() - t0
     print(f'\n{count} downloads in {elapsed:.2f}s')
 
+def get_tools_before_cli() -> str:
+    '''
+    A helper function that finds the last git revision before the command line interface was
+    added, so the startup benchmark can compare against the tools as they were then.
+
+    Returns:
+        a git revision
+    '''
+    src = os.path.dirname(os.path.abspath(__file__))
+    added = subprocess.run(['git', 'log', '-n', '1', '--diff-filter=A', '--format=%h', '--',
+                            'cli.py'], cwd=src, check=True, capture_output=True,
+                           text=True).stdout.strip()
+    if not added:
+        raise Exception('Could not find the commit that added cli.py in the git history.')
+
+    return f'{added}^'
+
+def startup(runs: int = 10, revision: str = None):
+    '''
+    Compares how long it takes to start a report with the command line interface, against running
+    analytics.py checked out from the git history, when every tool was imported upfront. Both run
+    against a database socket that does not exist, so they stop right after starting: the report
+    fails to connect, and the old analytics.py has nothing to run outside of its imports. Every run
+    is a fresh Python process, so nothing is cached between them.
+
+    Arguments:
+        runs - how many times each command should be started
+        revision - a git revision to take the old tools from, the last one before the command line
+            interface by default
+    '''
+    if runs < 1:
+        raise ValueError('runs needs to be at least 1')
+
+    src = os.path.dirname(os.path.abspath(__file__))
+    revision = revision or get_tools_before_cli()
+
+    with tempfile.TemporaryDirectory() as old_src:
+        archive = subprocess.run(['git', 'archive', revision, '.'], cwd=src, check=True,
+                                 capture_output=True).stdout
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            tar.extractall(old_src)
+
+        env = dict(os.environ, DB_HOSTNAME=os.path.join(old_src, 'no-database'))
+        commands = (
+            ('cli --help', [sys.executable, '-m', 'cli', '--help'], src),
+            ('cli report hottest', [sys.executable, '-m', 'cli', 'report', 'hottest'], src),
+            (f'analytics.py at {revision}', [sys.executable, 'analytics.py'], old_src),
+        )
+
+        for name, command, cwd in commands:
+            timings = []
+            for _ in range(runs):
+                t0 = time.perf_counter()
+                subprocess.run(command, cwd=cwd, env=env, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+                timings.append(time.perf_counter() - t0)
+
+            timings.sort()
+            print(f'{name}: median {timings[runs // 2] * 1000:.0f}ms, '
+                  f'best {timings[0] * 1000:.0f}ms over {runs} runs')
+
 if __name__ == '__main__':
     main(processes)
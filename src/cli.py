@@ -0,0 +1,272 @@
+'''
+A single entry point for all the tools. Run it from the src directory:
+
+    python3 -m cli fetch
+    python3 -m cli report hottest coldest --period yesterday --timings
+
+The tools are only imported when their subcommand runs, so asking for help or running one report
+does not pay for loading psycopg2, requests and all the other tools.
+'''
+
+import argparse
+import json
+import sys
+import time
+from contextlib import redirect_stdout
+from datetime import date, datetime
+from decimal import Decimal
+
+STARTED = time.perf_counter()
+
+PERIODS = ('today', 'yesterday', 'current_week', 'last_7_days')
+
+STATS_FIELDS = ('max', 'min', 'stddev')
+EXTREME_FIELDS = ('time', 'temperature', 'city')
+
+def named(rows: list[tuple], fields: tuple[str]) -> list[dict]:
+    '''
+    Gives the rows from the database as dictionaries with the provided field names.
+    '''
+    return [dict(zip(fields, row)) for row in rows]
+
+def named_one(rows: list[tuple], fields: tuple[str]) -> dict:
+    '''
+    Gives the single row the statistics return as a dictionary, or None if there was no data.
+    '''
+    return named(rows, fields)[0] if rows else None
+
+def report_countries(analytics, conn, args):
+    return [country for country, in analytics.get_countries(conn)]
+
+def report_city_stats(analytics, conn, args):
+    if args.city:
+        cities = args.city
+    else:
+        from weather import get_cities
+        cities = [name for _, name, _, _, _ in get_cities(conn)]
+
+    return {city: named_one(analytics.get_stats_for_city(city, args.period, conn),
+                            ('city', ) + STATS_FIELDS)
+            for city in cities}
+
+def report_country_stats(analytics, conn, args):
+    countries = args.country or report_countries(analytics, conn, args)
+    return {country: named_one(analytics.get_stats_for_country(country, args.period, conn),
+                               ('country', ) + STATS_FIELDS)
+            for country in countries}
+
+def report_radius_stats(analytics, conn, args):
+    latitude, longtitude, distance = args.radius
+    return named_one(analytics.get_stats_for_radius(latitude, longtitude, distance, args.period,
+                                                    conn),
+                     ('cities', ) + STATS_FIELDS)
+
+def report_bounding_box_stats(analytics, conn, args):
+    return named_one(analytics.get_stats_for_bounding_box(*args.bbox, args.period, conn),
+                     ('cities', ) + STATS_FIELDS)
+
+def report_hottest(analytics, conn, args):
+    hourly, daily, weekly = analytics.get_hottest_cities(conn)
+    return {'hourly': named(hourly, EXTREME_FIELDS), 'daily': named(daily, EXTREME_FIELDS),
+            'weekly': named(weekly, EXTREME_FIELDS)}
+
+def report_coldest(analytics, conn, args):
+    hourly, daily, weekly = analytics.get_coldest_cities(conn)
+    return {'hourly': named(hourly, EXTREME_FIELDS), 'daily': named(daily, EXTREME_FIELDS),
+            'weekly': named(weekly, EXTREME_FIELDS)}
+
+def report_rainy(analytics, conn, args):
+    yesterday, last_week = analytics.get_rainy_days(conn)
+    return {'yesterday': named(yesterday, ('city', 'rainy_hours')),
+            'last_week': named(last_week, ('city', 'rainy_hours'))}
+
+REPORTS = {
+    'countries': report_countries,
+    'city_stats': report_city_stats,
+    'country_stats': report_country_stats,
+    'radius_stats': report_radius_stats,
+    'bounding_box_stats': report_bounding_box_stats,
+    'hottest': report_hottest,
+    'coldest': report_coldest,
+    'rainy': report_rainy,
+}
+
+def to_json(value):
+    '''
+    Converts the values psycopg2 gives back, that json does not know about.
+    '''
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def run_report(args) -> None:
+    '''
+    Runs the requested analytics in one connection and one REPEATABLE READ transaction, so all of
+    them see the same snapshot of the database, and prints the results as JSON. If any of them
+    fails, nothing is printed to stdout and the command exits with status 1.
+    '''
+    reports = args.reports
+    if not reports:
+        reports = [name for name in REPORTS if name not in ('radius_stats', 'bounding_box_stats')]
+        if args.radius:
+            reports.append('radius_stats')
+        if args.bbox:
+            reports.append('bounding_box_stats')
+
+    timings = {}
+
+    t0 = time.perf_counter()
+    from os import getenv
+    import psycopg2
+    from psycopg2.extensions import ISOLATION_LEVEL_REPEATABLE_READ
+    import analytics
+    timings['imports'] = time.perf_counter() - t0
+
+    conn = None
+    step = 'while connecting to the database'
+    results = {}
+    try:
+        t0 = time.perf_counter()
+        conn = psycopg2.connect(database = getenv('DB_NAME'),
+                            host = getenv('DB_HOSTNAME'),
+                            user = getenv('DB_USERNAME'),
+                            password = getenv('DB_PASSWORD'))
+        conn.set_session(isolation_level=ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+        timings['connect'] = time.perf_counter() - t0
+
+        # Keep anything the tools print out of the JSON on stdout.
+        with redirect_stdout(sys.stderr):
+            for name in reports:
+                step = f'in the {name} report'
+                t0 = time.perf_counter()
+                results[name] = REPORTS[name](analytics, conn, args)
+                timings[name] = time.perf_counter() - t0
+    except psycopg2.Error as error:
+        print(f"Database error {step}:", error, file=sys.stderr)
+        sys.exit(1)
+    except Exception as error:
+        print(f"Error {step}:", error, file=sys.stderr)
+        sys.exit(1)
+    finally:
+        # Closing the connection also ends the read-only transaction.
+        if conn is not None:
+            conn.close()
+
+    timings['total'] = time.perf_counter() - STARTED
+
+    output = {'period': args.period, 'reports': results}
+    if args.timings:
+        output['timings'] = timings
+
+    print(json.dumps(output, default=to_json, indent=args.indent))
+
+def run_fetch(args) -> None:
+    import weather
+    weather.main()
+
+def run_locate(args) -> None:
+    import find_city_location
+    if args.cities:
+        find_city_location.main(tuple(args.cities))
+    else:
+        find_city_location.main()
+
+def run_index(args) -> None:
+    import spatial
+    spatial.create_database_indexes()
+
+def run_fill(args) -> None:
+    import fill_older_data
+    fill_older_data.main()
+
+def run_benchmark(args) -> None:
+    import benchmark
+    if args.method == 'startup':
+        benchmark.startup(args.runs)
+    else:
+        benchmark.main(getattr(benchmark, args.method))
+
+def positive_int(value: str) -> int:
+    '''
+    An argparse type for the arguments, that need to be at least 1.
+    '''
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f'{value} is not a positive number')
+    return number
+
+class RadiusAction(argparse.Action):
+    '''
+    An argparse action for --radius, that makes sure the distance is not negative.
+    '''
+    def __call__(self, parser, namespace, values, option_string=None):
+        if values[2] < 0:
+            parser.error(f'argument {option_string}: KM can not be negative, got {values[2]:g}')
+        setattr(namespace, self.dest, values)
+
+def get_parser() -> argparse.ArgumentParser:
+    '''
+    Builds the command line parser with all the subcommands.
+    '''
+    parser = argparse.ArgumentParser(prog='python3 -m cli',
+                                     description='Weather data system with Python and SQL.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    fetch = subparsers.add_parser('fetch', help='get the current weather for all the cities')
+    fetch.set_defaults(func=run_fetch)
+
+    locate = subparsers.add_parser('locate', help='find the cities location and upload them')
+    locate.add_argument('cities', nargs='*', help='city names, the default list if not provided')
+    locate.set_defaults(func=run_locate)
+
+    index = subparsers.add_parser('index', help='create the database indexes')
+    index.set_defaults(func=run_index)
+
+    fill = subparsers.add_parser('fill', help='fill the older entries with estimated data')
+    fill.set_defaults(func=run_fill)
+
+    bench = subparsers.add_parser('benchmark', help='measure the download or the startup time')
+    bench.add_argument('method', choices=('sequential', 'threads', 'processes', 'coroutines',
+                                          'startup'))
+    bench.add_argument('--runs', type=positive_int, default=10, help='how many runs for startup')
+    bench.set_defaults(func=run_benchmark)
+
+    report = subparsers.add_parser('report', help='run analytics in one snapshot and print JSON')
+    report.add_argument('reports', nargs='*', metavar='REPORT',
+                        help=f'reports to run, all of them if not provided: {", ".join(REPORTS)}')
+    report.add_argument('--period', choices=PERIODS, default='today')
+    report.add_argument('--city', action='append', help='city for city_stats, can be repeated')
+    report.add_argument('--country', action='append',
+                        help='country code for country_stats, can be repeated')
+    report.add_argument('--radius', nargs=3, type=float, action=RadiusAction,
+                        metavar=('LAT', 'LON', 'KM'),
+                        help='region for radius_stats')
+    report.add_argument('--bbox', nargs=4, type=float,
+                        metavar=('MIN_LAT', 'MIN_LON', 'MAX_LAT', 'MAX_LON'),
+                        help='region for bounding_box_stats')
+    report.add_argument('--timings', action='store_true',
+                        help='include how long every step took, in seconds')
+    report.add_argument('--indent', type=int, default=None, help='indent the JSON output')
+    report.set_defaults(func=run_report)
+
+    return parser
+
+def main(argv: list[str] = None) -> None:
+    parser = get_parser()
+    args = parser.parse_args(argv)
+
+    if args.command == 'report':
+        for name in args.reports:
+            if name not in REPORTS:
+                parser.error(f'invalid report: {name} (choose from {", ".join(REPORTS)})')
+        if 'radius_stats' in args.reports and not args.radius:
+            parser.error('radius_stats needs --radius')
+        if 'bounding_box_stats' in args.reports and not args.bbox:
+            parser.error('bounding_box_stats needs --bbox')
+
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
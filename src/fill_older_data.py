@@ -61,7 +61,10 @@ def get_first_measurement():
         cursor.close()
         conn.close()
 
-if __name__ == "__main__":
+def main():
+    '''
+    Fills the weather table with estimated measurements for six weeks before the first one.
+    '''
     # 13:20
     current_datetime = get_first_measurement()[0][0] - datetime.timedelta(hours=1)
     six_weeks_ago = current_datetime - datetime.timedelta(weeks=6)
@@ -78,3 +81,6 @@ if __name__ == "__main__":
             upload_city_weather_data_to_db(city_id, current_datetime, estimated_temp, description)
 
         current_datetime = current_datetime - datetime.timedelta(hours=1)
+
+if __name__ == "__main__":
+    main()
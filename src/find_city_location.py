@@ -6,8 +6,8 @@ server as input for all the other tools.
 
 from os import getenv
 from dotenv import load_dotenv
-from requests import get
 import psycopg2
+from spatial import create_database_indexes
 
 load_dotenv()
 
@@ -46,16 +46,30 @@ def get_city_location(city_name: str) -> tuple[str, float, float]:
     Returns:
         tuple with three arguments - city name, city latitude, city longtitude, country that the city is in
     '''
+    # Imported here, so the tools that never call the API do not pay for loading requests.
+    from requests import get
+
     response = get(f"http://api.openweathermap.org/geo/1.0/direct?q={city_name}&limit=1&"
                    f"appid={getenv('OPENWEATHER_API_KEY')}", timeout=10)
     return response.json()[0]['name'], response.json()[0]['lat'], response.json()[0]['lon'], response.json()[0]['country']
 
-if __name__ == "__main__":
-    # Tuple with city names, that we want to check and import to the database.
-    cities_to_locate = ('Istanbul', 'London', 'Saint Petersburg', 'Berlin', 'Madrid', 'Kyiv',
-                        'Rome', 'Bucharest', 'Paris', 'Minsk', 'Vienna', 'Warsaw', 'Hamburg',
-                        'Budapest', 'Belgrade', 'Barcelona', 'Munich', 'Kharkiv', 'Milan')
+# Tuple with city names, that we want to check and import to the database.
+CITIES_TO_LOCATE = ('Istanbul', 'London', 'Saint Petersburg', 'Berlin', 'Madrid', 'Kyiv',
+                    'Rome', 'Bucharest', 'Paris', 'Minsk', 'Vienna', 'Warsaw', 'Hamburg',
+                    'Budapest', 'Belgrade', 'Barcelona', 'Munich', 'Kharkiv', 'Milan')
 
+def main(cities_to_locate: tuple[str] = CITIES_TO_LOCATE):
+    '''
+    Finds the location of the cities and uploads them to the database.
+
+    Arguments:
+        cities_to_locate - a tuple with city names, that we want to import to the database
+    '''
     for city in cities_to_locate:
         city_name, city_lat, city_lon, country = get_city_location(city)
         upload_city_location_to_db(city_name, city_lat, city_lon, country)
+
+    create_database_indexes()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,493 @@
+'''
+A set of tools, that will help to find cities near a place or inside of a region without pulling
+the whole cities table and filtering it by hand. The cities are kept in an in-memory KD-tree, that
+is rebuilt whenever the cities table changes.
+'''
+
+import heapq
+import sys
+from bisect import bisect_left, bisect_right
+from math import asin, cos, radians, sin, sqrt
+from os import getenv
+from dotenv import load_dotenv
+import psycopg2
+from weather import get_cities
+
+load_dotenv()
+
+EARTH_RADIUS_KM = 6371.0088
+
+def to_cartesian(latitude: float, longtitude: float) -> tuple[float, float, float]:
+    '''
+    Converts geographical position to a point on a unit sphere. The straight line distance between
+    two such points grows together with the great-circle distance, so the KD-tree can compare them
+    instead of computing haversine for every city.
+
+    Arguments:
+        latitude - a geographical latitude
+        longtitude - a geographical longtitude
+
+    Returns:
+        a tuple with x, y, z coordinates
+    '''
+    lat, lon = radians(latitude), radians(longtitude)
+    return cos(lat) * cos(lon), cos(lat) * sin(lon), sin(lat)
+
+def chord_to_km(chord: float) -> float:
+    '''
+    Converts a straight line distance on the unit sphere to a great-circle distance in kilometers.
+    '''
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, chord / 2))
+
+def km_to_chord(distance: float) -> float:
+    '''
+    Converts a great-circle distance in kilometers to a straight line distance on the unit sphere.
+    '''
+    return 2 * sin(min(distance / EARTH_RADIUS_KM, 3.141592653589793) / 2)
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    '''
+    Calculates the great-circle distance between two places.
+
+    Arguments:
+        lat1, lon1 - a geographical position of the first place
+        lat2, lon2 - a geographical position of the second place
+
+    Returns:
+        distance in kilometers
+    '''
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+
+class CityIndex:
+    '''
+    An in-memory spatial index over cities, as returned by weather.get_cities(), that is:
+    city_id, name, latitude, longtitude, country.
+
+    Nearest-city and radius queries are answered by a KD-tree built over the cities positions on a
+    unit sphere. Bounding-box queries are answered by a list of cities sorted by latitude.
+    '''
+
+    def __init__(self, cities: list[tuple[int, str, float, float, str]]):
+        self.cities = list(cities)
+        points = [(to_cartesian(city[2], city[3]), city) for city in self.cities]
+        self.root = self._build(points, 0)
+        self.by_latitude = sorted(self.cities, key=lambda city: city[2])
+        self.latitudes = [city[2] for city in self.by_latitude]
+
+    def __len__(self):
+        return len(self.cities)
+
+    def _build(self, points: list, axis: int):
+        '''
+        Recursively builds the KD-tree. Every node is a tuple of: point, city, axis, left, right.
+        '''
+        if not points:
+            return None
+
+        points.sort(key=lambda point: point[0][axis])
+        median = len(points) // 2
+        next_axis = (axis + 1) % 3
+
+        return (points[median][0], points[median][1], axis,
+                self._build(points[:median], next_axis),
+                self._build(points[median + 1:], next_axis))
+
+    def nearest(self, latitude: float, longtitude: float, k: int = 1) -> list[tuple[float, tuple]]:
+        '''
+        Finds k cities nearest to the provided place.
+
+        Arguments:
+            latitude - a geographical latitude of the place
+            longtitude - a geographical longtitude of the place
+            k - how many cities you want to get
+
+        Returns:
+            a list of tuples with distance in kilometers and the city, closest first
+        '''
+        if k <= 0:
+            return []
+
+        target = to_cartesian(latitude, longtitude)
+        # A max-heap on the squared chord, so the furthest of the k best is on top.
+        best = []
+        counter = 0
+        # Every subtree is kept together with the smallest squared chord any of its cities can
+        # have, and is skipped when popped if the k best found by then are all closer than that.
+        stack = [(self.root, 0.0)]
+
+        while stack:
+            node, bound = stack.pop()
+            if node is None or (len(best) == k and bound >= -best[0][0]):
+                continue
+
+            point, city, axis, left, right = node
+            dist = sum((p - t) ** 2 for p, t in zip(point, target))
+            if len(best) < k:
+                heapq.heappush(best, (-dist, counter, city))
+            elif dist < -best[0][0]:
+                heapq.heapreplace(best, (-dist, counter, city))
+            counter += 1
+
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            stack.append((far, max(bound, diff ** 2)))
+            stack.append((near, bound))
+
+        return [(chord_to_km(sqrt(-dist)), city) for dist, _, city in sorted(best, reverse=True)]
+
+    def within_radius(self, latitude: float, longtitude: float,
+                      distance: float) -> list[tuple[float, tuple]]:
+        '''
+        Finds all cities within the provided distance from the place.
+
+        Arguments:
+            latitude - a geographical latitude of the place
+            longtitude - a geographical longtitude of the place
+            distance - a radius in kilometers, it can not be negative
+
+        Returns:
+            a list of tuples with distance in kilometers and the city, closest first
+        '''
+        if distance < 0:
+            raise ValueError(f'The radius can not be negative, got {distance} km.')
+
+        target = to_cartesian(latitude, longtitude)
+        limit = km_to_chord(distance) ** 2
+        found = []
+        stack = [self.root]
+
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+
+            point, city, axis, left, right = node
+            dist = sum((p - t) ** 2 for p, t in zip(point, target))
+            if dist <= limit:
+                found.append((chord_to_km(sqrt(dist)), city))
+
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            if diff ** 2 <= limit:
+                stack.append(far)
+            stack.append(near)
+
+        return sorted(found, key=lambda item: item[0])
+
+    def within_bounding_box(self, min_latitude: float, min_longtitude: float,
+                            max_latitude: float, max_longtitude: float) -> list[tuple]:
+        '''
+        Finds all cities inside the provided bounding box. If min_longtitude is bigger than
+        max_longtitude, the box is treated as crossing the 180th meridian.
+
+        Arguments:
+            min_latitude, min_longtitude - the south-west corner of the box
+            max_latitude, max_longtitude - the north-east corner of the box
+
+        Returns:
+            a list of cities inside the box
+        '''
+        start = bisect_left(self.latitudes, min_latitude)
+        end = bisect_right(self.latitudes, max_latitude)
+
+        if min_longtitude <= max_longtitude:
+            return [city for city in self.by_latitude[start:end]
+                    if min_longtitude <= city[3] <= max_longtitude]
+
+        return [city for city in self.by_latitude[start:end]
+                if city[3] >= min_longtitude or city[3] <= max_longtitude]
+
+def get_cities_fingerprint(conn=None) -> tuple:
+    '''
+    A helper function that gets a summary of the cities table, that changes whenever cities are
+    added, removed or moved to a different position.
+
+    It reads the cities_version counter, that a trigger on the cities table bumps on every change,
+    so it costs a single row lookup. If the counter was not created yet with
+    create_database_indexes(), it falls back to hashing all the cities positions, which scans the
+    whole cities table on every call.
+
+    Arguments:
+        conn - an open database connection to use, a new one is opened and closed if not provided.
+            Errors are raised when it is provided, instead of being printed
+
+    Returns:
+        a tuple with the cities_version counter, or with the number of cities and a hash of all the
+        cities ids and positions if there is no counter
+    '''
+
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(database = getenv('DB_NAME'),
+                            host = getenv('DB_HOSTNAME'),
+                            user = getenv('DB_USERNAME'),
+                            password = getenv('DB_PASSWORD'))
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT to_regclass('cities_version') IS NOT NULL;")
+        if cursor.fetchone()[0]:
+            cursor.execute("SELECT version FROM cities_version;")
+            return cursor.fetchone()
+
+        cursor.execute("""
+                       SELECT count(*),
+                       md5(string_agg(city_id || ':' || latitude || ':' || longtitude, ','
+                                      ORDER BY city_id))
+                       FROM cities;
+                       """)
+
+        return cursor.fetchone()
+    except Exception as error:
+        if not own_conn:
+            raise
+        print("Database error:", error)
+    finally:
+        cursor.close()
+        if own_conn:
+            conn.close()
+
+_city_index = None
+_city_index_fingerprint = None
+
+def get_city_index(conn=None) -> CityIndex:
+    '''
+    Gives the spatial index over the cities from the database. The index is kept in memory and
+    rebuilt only when the cities table has changed since it was last built.
+
+    Arguments:
+        conn - an open database connection to use, a new one is opened and closed if not provided.
+            Errors are raised when it is provided, instead of being printed
+
+    Returns:
+        a CityIndex object
+    '''
+    global _city_index, _city_index_fingerprint
+
+    fingerprint = get_cities_fingerprint(conn)
+    if _city_index is None or fingerprint != _city_index_fingerprint:
+        _city_index = CityIndex(get_cities(conn) or [])
+        _city_index_fingerprint = fingerprint
+
+    return _city_index
+
+def create_database_indexes() -> None:
+    '''
+    Creates the database side index on the weather measurements per city and time, so the
+    regional statistics for the cities found with the spatial index do not need to scan the whole
+    weather table. It also creates the cities_version counter with a trigger, that bumps it on
+    every change of the cities table, so get_city_index() can tell cheaply if it needs a rebuild.
+    It is safe to run it many times.
+
+    Returns:
+        none
+    '''
+
+    conn = psycopg2.connect(database = getenv('DB_NAME'),
+                        host = getenv('DB_HOSTNAME'),
+                        user = getenv('DB_USERNAME'),
+                        password = getenv('DB_PASSWORD'))
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("CREATE INDEX IF NOT EXISTS weather_city_id_time_idx "
+                       "ON weather (city_id, time);")
+        cursor.execute("""
+                       CREATE TABLE IF NOT EXISTS cities_version (version bigint NOT NULL);
+                       INSERT INTO cities_version (version)
+                       SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM cities_version);
+
+                       CREATE OR REPLACE FUNCTION bump_cities_version() RETURNS trigger AS $$
+                       BEGIN
+                           UPDATE cities_version SET version = version + 1;
+                           RETURN NULL;
+                       END;
+                       $$ LANGUAGE plpgsql;
+
+                       CREATE OR REPLACE TRIGGER cities_version_trigger
+                       AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON cities
+                       FOR EACH STATEMENT EXECUTE FUNCTION bump_cities_version();
+                       """)
+
+        conn.commit()
+    except Exception as error:
+        print("Error while creating the database indexes:", error)
+    finally:
+        cursor.close()
+        conn.close()
+
+def linear_nearest(cities: list[tuple], latitude: float, longtitude: float,
+                   k: int = 1) -> list[tuple[float, tuple]]:
+    '''
+    Finds k cities nearest to the place by checking every city. Used as the baseline for the
+    check and the benchmark below.
+    '''
+    return heapq.nsmallest(k, ((haversine(latitude, longtitude, city[2], city[3]), city)
+                               for city in cities), key=lambda item: item[0])
+
+def linear_within_radius(cities: list[tuple], latitude: float, longtitude: float,
+                         distance: float) -> list[tuple[float, tuple]]:
+    '''
+    Finds all cities within the distance from the place by checking every city. Used as the
+    baseline for the check and the benchmark below.
+    '''
+    found = [(haversine(latitude, longtitude, city[2], city[3]), city) for city in cities]
+    return sorted([item for item in found if item[0] <= distance], key=lambda item: item[0])
+
+def linear_within_bounding_box(cities: list[tuple], min_latitude: float, min_longtitude: float,
+                                max_latitude: float, max_longtitude: float) -> list[tuple]:
+    '''
+    Finds all cities inside the bounding box by checking every city. Used as the baseline for the
+    check below.
+    '''
+    if min_longtitude <= max_longtitude:
+        return [city for city in cities if min_latitude <= city[2] <= max_latitude
+                and min_longtitude <= city[3] <= max_longtitude]
+
+    return [city for city in cities if min_latitude <= city[2] <= max_latitude
+            and (city[3] >= min_longtitude or city[3] <= max_longtitude)]
+
+def compare_results(name: str, latitude: float, longtitude: float, got: list[tuple[float, tuple]],
+                    expected: list[tuple[float, tuple]]) -> None:
+    '''
+    Compares the index results with the linear scan ones. Cities at the same distance can come in
+    a different order, so it compares the distances, and checks every returned distance against
+    haversine for that city.
+
+    Raises:
+        Exception if the results do not match
+    '''
+    tolerance = 1e-6
+    got_ids = [city[0] for _, city in got]
+
+    if len(got) != len(expected):
+        raise Exception(f'{name} at ({latitude}, {longtitude}): got {len(got)} cities, '
+                        f'expected {len(expected)}.')
+    if len(set(got_ids)) != len(got_ids):
+        raise Exception(f'{name} at ({latitude}, {longtitude}): got a city more than once.')
+
+    for (got_distance, city), (expected_distance, _) in zip(got, expected):
+        real_distance = haversine(latitude, longtitude, city[2], city[3])
+        if (abs(got_distance - expected_distance) > tolerance
+                or abs(got_distance - real_distance) > tolerance):
+            raise Exception(f'{name} at ({latitude}, {longtitude}): got city {city[0]} at '
+                            f'{got_distance} km, expected a city at {expected_distance} km.')
+
+def check(city_count: int = 2000, query_count: int = 150) -> None:
+    '''
+    Checks, that the spatial index gives the same cities as the linear scan, for random places all
+    over the globe and for the edge cases: asking for more cities than there are, cities in the
+    same place, the poles, the 180th meridian and an empty index. It does not need the database.
+
+    Raises:
+        Exception if any of the results do not match
+    '''
+    import random
+
+    random.seed(1)
+    cities = [(city_id, f'city_{city_id}', random.uniform(-90, 90), random.uniform(-180, 180), 'XX')
+              for city_id in range(city_count)]
+    # Cities in the same place, at the poles and around the 180th meridian.
+    city_id = city_count
+    for lat, lon in ([(48.85, 2.35)] * 20 + [(90, lon) for lon in (-180, -90, 0, 90, 180)]
+                     + [(-90, 0), (89.99, 45), (-89.99, -135)]
+                     + [(lat, lon) for lat in (-5, 0, 5) for lon in (179.9, 180, -180, -179.9)]):
+        cities.append((city_id, f'city_{city_id}', lat, lon, 'XX'))
+        city_id += 1
+
+    index = CityIndex(cities)
+    queries = ([(random.uniform(-90, 90), random.uniform(-180, 180)) for _ in range(query_count)]
+               + [(48.85, 2.35), (90, 0), (-90, 123), (89.999, -60), (0, 180), (0, -180),
+                  (3, 179.95)])
+
+    for lat, lon in queries:
+        for k in (1, 5, 30):
+            compare_results(f'{k} nearest', lat, lon, index.nearest(lat, lon, k),
+                            linear_nearest(cities, lat, lon, k))
+        for distance in (0, 50, 500, 5000, 20100):
+            got = index.within_radius(lat, lon, distance)
+            expected = linear_within_radius(cities, lat, lon, distance)
+            compare_results(f'within {distance} km', lat, lon, got, expected)
+
+    for box in ((-10, 170, 10, -170), (-10, 179.9, 10, -179.9), (80, -180, 90, 180),
+                (-90, -10, -60, 10), (40, 0, 50, 10), (10, 10, -10, 20)):
+        got = sorted(city[0] for city in index.within_bounding_box(*box))
+        expected = sorted(city[0] for city in linear_within_bounding_box(cities, *box))
+        if got != expected:
+            raise Exception(f'bounding box {box}: got cities {got}, expected {expected}.')
+
+    if len(index.nearest(48.85, 2.35, 20)) != 20 or index.nearest(48.85, 2.35, 20)[-1][0] != 0:
+        raise Exception('20 nearest to the 20 cities in the same place are not all of them.')
+    if len(index.within_radius(48.85, 2.35, 0)) != 20:
+        raise Exception('Radius 0 around the 20 cities in the same place does not find them all.')
+
+    small = CityIndex(cities[:10])
+    compare_results('more than there are', 0, 0, small.nearest(0, 0, 25),
+                    linear_nearest(cities[:10], 0, 0, 25))
+
+    empty = CityIndex([])
+    if empty.nearest(0, 0, 5) or empty.within_radius(0, 0, 500) or empty.within_bounding_box(
+            -90, -180, 90, 180):
+        raise Exception('An empty index found some cities.')
+
+    try:
+        index.within_radius(0, 0, -200)
+    except ValueError:
+        pass
+    else:
+        raise Exception('A negative radius was accepted.')
+
+    print(f'Index matches the linear scan for {len(queries)} places and all the edge cases')
+
+def main(city_count: int = 50000, query_count: int = 1000):
+    '''
+    Compares the spatial index with the linear scan over randomly placed cities, after checking
+    that they give the same results. It does not need the database, so you can run it anywhere.
+    '''
+    import random
+    import time
+
+    check()
+
+    random.seed(0)
+    cities = [(city_id, f'city_{city_id}', random.uniform(-60, 70), random.uniform(-180, 180), 'XX')
+              for city_id in range(city_count)]
+    queries = [(random.uniform(-60, 70), random.uniform(-180, 180)) for _ in range(query_count)]
+
+    t0 = time.perf_counter()
+    index = CityIndex(cities)
+    print(f'Index built for {city_count} cities in {time.perf_counter() - t0:.2f}s')
+
+    for name, indexed, linear in (
+        ('5 nearest cities',
+         lambda lat, lon: index.nearest(lat, lon, 5),
+         lambda lat, lon: linear_nearest(cities, lat, lon, 5)),
+        ('cities within 200 km',
+         lambda lat, lon: index.within_radius(lat, lon, 200),
+         lambda lat, lon: linear_within_radius(cities, lat, lon, 200))):
+
+        t0 = time.perf_counter()
+        indexed_results = [indexed(lat, lon) for lat, lon in queries]
+        indexed_elapsed = time.perf_counter() - t0
+
+        # The linear scan is slow, so it runs a tenth of the queries and the time is scaled up.
+        t0 = time.perf_counter()
+        linear_results = [linear(lat, lon) for lat, lon in queries[:query_count // 10]]
+        linear_elapsed = (time.perf_counter() - t0) * 10
+
+        for (lat, lon), got, expected in zip(queries, indexed_results, linear_results):
+            compare_results(name, lat, lon, got, expected)
+
+        print(f'{name}: index {indexed_elapsed:.2f}s, linear scan {linear_elapsed:.2f}s '
+              f'for {query_count} queries ({linear_elapsed / indexed_elapsed:.0f}x faster)')
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ['index']:
+        create_database_indexes()
+    elif sys.argv[1:] == ['check']:
+        check()
+    else:
+        main()
@@ -7,22 +7,27 @@ import datetime
 from os import getenv
 from dotenv import load_dotenv
 import psycopg2
-from requests import get
 
 load_dotenv()
 
-def get_cities() -> list[tuple[str, float, float]]:
+def get_cities(conn=None) -> list[tuple[str, float, float]]:
     '''
     This function get the city_id, it's latitude and longtitude from the cities table in the
     database and returns this list as a list of tuples.
 
+    Arguments:
+        conn - an open database connection to use, a new one is opened and closed if not provided.
+            Errors are raised when it is provided, instead of being printed
+
     Returns:
         none
     '''
-    conn = psycopg2.connect(database = getenv('DB_NAME'),
-                        host = getenv('DB_HOSTNAME'),
-                        user = getenv('DB_USERNAME'),
-                        password = getenv('DB_PASSWORD'))
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(database = getenv('DB_NAME'),
+                            host = getenv('DB_HOSTNAME'),
+                            user = getenv('DB_USERNAME'),
+                            password = getenv('DB_PASSWORD'))
 
     try:
         cursor = conn.cursor()
@@ -30,10 +35,13 @@ def get_cities() -> list[tuple[str, float, float]]:
 
         return cursor.fetchall()
     except Exception as error:
+        if not own_conn:
+            raise
         print("Database connection error:", error)
     finally:
         cursor.close()
-        conn.close()
+        if own_conn:
+            conn.close()
 
 
 def get_city_weather(latitude: float, longtitude: float):
@@ -51,6 +59,8 @@ def get_city_weather(latitude: float, longtitude: float):
             temp - a temperature in Celsius degrees
             description - a human-readable weather description
     '''
+    # Imported here, so the tools that never call the API do not pay for loading requests.
+    from requests import get
 
     try:
         response = get(f"https://api.openweathermap.org/data/2.5/weather?lat={latitude}"
@@ -102,7 +112,13 @@ def upload_city_weather_data_to_db(city_id: int, timestamp: datetime.datetime, t
         cursor.close()
         conn.close()
 
-if __name__ == "__main__":
+def main():
+    '''
+    Gets the current weather for all the cities in the database and stores it there.
+    '''
     for city_id, _, lat, lon, _ in get_cities():
         timestamp, temp, description = get_city_weather(lat, lon)
         upload_city_weather_data_to_db(city_id, timestamp, temp, description)
+
+if __name__ == "__main__":
+    main()